@@ -7,8 +7,7 @@ from __future__ import annotations
 
 import datetime as _dt
 import os
-from types import ModuleType
-from typing import List, Optional, Tuple
+from typing import List, Optional
 
 import pandas as pd
 import plotly.express as px
@@ -24,15 +23,24 @@ try:  # new location (src/ sub-package)
         run_business_keyword_pipeline,
     )
 
+    _PIPELINE_AVAILABLE = True
+
 except ModuleNotFoundError:
     # fall back to the old flat layout
-    from enhanced_keyword_pipeline import (  # type: ignore
-        combine_data_for_assistant,
-        extract_business_names_from_pinecone,
-        get_search_volume_with_history,
-        preprocess_business_names,
-        run_business_keyword_pipeline,
-    )
+    try:
+        from enhanced_keyword_pipeline import (  # type: ignore
+            combine_data_for_assistant,
+            extract_business_names_from_pinecone,
+            get_search_volume_with_history,
+            preprocess_business_names,
+            run_business_keyword_pipeline,
+        )
+
+        _PIPELINE_AVAILABLE = True
+
+    except ModuleNotFoundError:
+        # resolved once here instead of probing globals() on every render
+        _PIPELINE_AVAILABLE = False
 
 
 def _nice_csv_download(df: pd.DataFrame, *, prefix: str) -> None:
@@ -56,7 +64,7 @@ def render_business_keywords_tab() -> None:  # noqa: C901 (streamlit UI; okay)
     st.header("🔑 Business Names → Keyword Pipeline")
 
     # bail out gracefully if helpers are missing
-    if "extract_business_names_from_pinecone" not in globals():
+    if not _PIPELINE_AVAILABLE:
         st.error(
             "Enhanced keyword-pipeline module could not be imported. "
             "Make sure it exists in either `src/` or the repo root."
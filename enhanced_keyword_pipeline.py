@@ -3,14 +3,21 @@ enhanced_keyword_pipeline.py - Pipeline to extract business names,
 get search volumes with 12-month history, and store in Pinecone
 """
 import os
+import re
+import json
+import time
+import sqlite3
 import logging
+import datetime
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from pinecone import Pinecone
-from openai import OpenAI
 
 # Import existing components
-from src.config import secret
+from src.config import EMBED_TIMEOUT, secret, openai_client
 from src.fetch_volume import fetch_volume
 from src.embed_upsert import upsert_keywords
 
@@ -18,6 +25,40 @@ from src.embed_upsert import upsert_keywords
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Separators between a brand and its location in a business name,
+# e.g. "Zara - Phoenix Mall" or "Zara, MG Road"
+_BRAND_SEPARATOR_RE = re.compile(r" - |,")
+
+# DataForSEO accepts up to 1000 keywords per search-volume request
+VOLUME_CHUNK_SIZE = 1000
+VOLUME_MAX_WORKERS = 4  # concurrent search-volume requests
+
+# Local cache of fetch_volume results; Google's volumes only change monthly
+VOLUME_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "kw_vol.sqlite")
+VOLUME_CACHE_TTL = 30 * 24 * 3600  # seconds
+
+# Column types of the search-volume DataFrame
+_VOLUME_DTYPES = {
+    "search_volume": "int32",
+    "year": "int32",
+    "month": "int32",
+    "competition": float,
+    "cpc": float,
+    "avg_monthly_volume": "int32",
+}
+
+@lru_cache(maxsize=None)
+def _get_index(index_name: str):
+    """Pinecone index handle, created once per index and reused across calls"""
+    pc = Pinecone(api_key=secret("PINECONE_API_KEY"))
+    return pc.Index(index_name)
+
+@lru_cache(maxsize=None)
+def _index_dimension(index_name: str) -> int:
+    """Vector dimension of an index (fixed at creation, so fetched only once)"""
+    stats = _get_index(index_name).describe_index_stats()
+    return stats.get("dimension", 1536)
+
 def extract_business_names_from_pinecone(index_name: str = "zecompete") -> List[str]:
     """
     Extract business names from Pinecone maps namespace
@@ -31,31 +72,39 @@ def extract_business_names_from_pinecone(index_name: str = "zecompete") -> List[
     logger.info("Extracting business names from Pinecone maps namespace")
     
     try:
-        # Initialize Pinecone
-        pc = Pinecone(api_key=secret("PINECONE_API_KEY"))
-        index = pc.Index(index_name)
+        index = _get_index(index_name)
         
-        # Get index stats to determine dimension
-        stats = index.describe_index_stats()
-        dimension = stats.get("dimension", 1536)
-        
-        # Create dummy vector for query (all zeros)
-        dummy_vector = [0.0] * dimension
-        
-        # Query the maps namespace
-        results = index.query(
-            vector=dummy_vector,
-            top_k=100,  # Get up to 100 businesses
-            namespace="maps",
-            include_metadata=True
-        )
-        
-        # Extract business names from metadata
         business_names = []
-        if results and results.matches:
-            for match in results.matches:
-                if match.metadata and 'name' in match.metadata:
-                    business_names.append(match.metadata['name'])
+        try:
+            # Enumerate the maps namespace by ID and fetch metadata in
+            # batches, instead of running a similarity query to list it
+            for id_batch in index.list(namespace="maps"):
+                fetched = index.fetch(ids=id_batch, namespace="maps")
+                for vector in fetched.vectors.values():
+                    if vector.metadata and 'name' in vector.metadata:
+                        business_names.append(vector.metadata['name'])
+        except Exception as e:
+            # list() is only supported on serverless indexes
+            logger.warning(f"Could not list maps namespace, falling back to query: {str(e)}")
+            
+            # Create dummy vector for query (all zeros)
+            dummy_vector = [0.0] * _index_dimension(index_name)
+            
+            # Query the maps namespace
+            results = index.query(
+                vector=dummy_vector,
+                top_k=1000,  # Pinecone's maximum when including metadata
+                namespace="maps",
+                include_values=False,
+                include_metadata=True
+            )
+            
+            # Extract business names from metadata
+            business_names = []
+            if results and results.matches:
+                for match in results.matches:
+                    if match.metadata and 'name' in match.metadata:
+                        business_names.append(match.metadata['name'])
         
         logger.info(f"Extracted {len(business_names)} business names")
         return business_names
@@ -64,6 +113,33 @@ def extract_business_names_from_pinecone(index_name: str = "zecompete") -> List[
         logger.error(f"Error extracting business names: {str(e)}")
         return []
 
+def _keyword_variants(business_names: List[str], city: str) -> Iterator[str]:
+    """Yield keyword variants for each distinct, non-empty business name"""
+    city_lower = city.lower()
+    
+    # Basic cleaning, then dedupe so each distinct business name (chains
+    # repeat the same name across branches) is only expanded once
+    for clean_name in dict.fromkeys(name.strip() for name in business_names):
+        if not clean_name:
+            continue
+            
+        # Keyword bases: the raw business name, plus the brand part when
+        # the name contains a location (" - " or ","), which is the part
+        # before the first separator
+        bases = [clean_name]
+        separator = _BRAND_SEPARATOR_RE.search(clean_name)
+        if separator:
+            brand_part = clean_name[:separator.start()].strip()
+            if len(brand_part) > 2:
+                bases.append(brand_part)
+        
+        # Expand every base into itself and itself + city (unless the
+        # city is already in it)
+        for base in bases:
+            yield base
+            if city_lower not in base.lower():
+                yield f"{base} {city}"
+
 def preprocess_business_names(business_names: List[str], city: str) -> List[str]:
     """
     Clean and preprocess business names to create effective keywords
@@ -77,40 +153,60 @@ def preprocess_business_names(business_names: List[str], city: str) -> List[str]
     """
     logger.info(f"Preprocessing {len(business_names)} business names with city: {city}")
     
-    keywords = []
-    for name in business_names:
-        # Basic cleaning
-        clean_name = name.strip()
-        if not clean_name:
-            continue
-            
-        # Add the raw business name
-        keywords.append(clean_name)
-        
-        # Add business name with city if not already in the name
-        if city.lower() not in clean_name.lower():
-            keywords.append(f"{clean_name} {city}")
-        
-        # If the business name contains location, extract the brand part
-        if " - " in clean_name:
-            brand_part = clean_name.split(" - ")[0].strip()
-            if brand_part and len(brand_part) > 2:
-                keywords.append(brand_part)
-                keywords.append(f"{brand_part} {city}")
-        
-        # If the business name contains comma, extract the brand part
-        if "," in clean_name:
-            brand_part = clean_name.split(",")[0].strip()
-            if brand_part and len(brand_part) > 2:
-                keywords.append(brand_part)
-                keywords.append(f"{brand_part} {city}")
-    
-    # Remove duplicates and empty strings
-    keywords = list(set([k for k in keywords if k]))
+    # Stream the variants straight into an order-preserving dedupe rather
+    # than collecting every variant in a list first
+    keywords = list(dict.fromkeys(_keyword_variants(business_names, city)))
     
     logger.info(f"Generated {len(keywords)} keywords from business names")
     return keywords
 
+def _volume_cache() -> sqlite3.Connection:
+    """Open the keyword volume cache, creating it on first use"""
+    os.makedirs(os.path.dirname(VOLUME_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(VOLUME_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS kw_vol "
+        "(keyword TEXT PRIMARY KEY, payload TEXT NOT NULL, fetched_at REAL NOT NULL)"
+    )
+    return conn
+
+def _load_cached_volumes(keywords: List[str]) -> Dict[str, Dict]:
+    """
+    Look up fetch_volume results stored within the last VOLUME_CACHE_TTL.
+    Keywords must already be lower-cased and unique; a failing cache is
+    treated as empty.
+    """
+    cutoff = time.time() - VOLUME_CACHE_TTL
+    cached = {}
+    try:
+        with closing(_volume_cache()) as conn:
+            # Stay under SQLite's limit on bound parameters per statement
+            for i in range(0, len(keywords), 900):
+                batch = keywords[i:i + 900]
+                rows = conn.execute(
+                    f"SELECT keyword, payload FROM kw_vol "
+                    f"WHERE fetched_at >= ? AND keyword IN ({','.join('?' * len(batch))})",
+                    [cutoff, *batch],
+                )
+                cached.update((keyword, json.loads(payload)) for keyword, payload in rows)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read keyword volume cache: {str(e)}")
+    return cached
+
+def _store_cached_volumes(results: Dict[str, Dict]) -> None:
+    """Save freshly fetched volumes (lower-cased keys) to the cache, replacing older entries"""
+    if not results:
+        return
+    now = time.time()
+    try:
+        with closing(_volume_cache()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kw_vol (keyword, payload, fetched_at) VALUES (?, ?, ?)",
+                [(keyword, json.dumps(data), now) for keyword, data in results.items()],
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update keyword volume cache: {str(e)}")
+
 def get_search_volume_with_history(keywords: List[str]) -> pd.DataFrame:
     """
     Get search volume data with 12-month history for keywords
@@ -121,61 +217,69 @@ def get_search_volume_with_history(keywords: List[str]) -> pd.DataFrame:
     Returns:
         DataFrame with keyword data including 12-month search history
     """
+    # Volumes don't depend on case, so each keyword is looked up, fetched,
+    # cached and returned once, lower-cased
+    keywords = list(dict.fromkeys(kw.lower() for kw in keywords))
     logger.info(f"Fetching search volume data for {len(keywords)} keywords")
     
     try:
-        # Call the existing fetch_volume function with trend data
-        results = fetch_volume(keywords, include_trends=True)
+        # Reuse volumes fetched within the cache TTL; only the rest are billed
+        results = _load_cached_volumes(keywords)
+        missing = [kw for kw in keywords if kw not in results]
+        logger.info(f"{len(keywords) - len(missing)} keywords found in volume cache, fetching {len(missing)}")
+        
+        # Call the existing fetch_volume function with trend data, one
+        # request per chunk of keywords, a few chunks at a time
+        chunks = [missing[i:i + VOLUME_CHUNK_SIZE] for i in range(0, len(missing), VOLUME_CHUNK_SIZE)]
+        fetched = {}
+        with ThreadPoolExecutor(max_workers=VOLUME_MAX_WORKERS) as executor:
+            for part in executor.map(lambda chunk: fetch_volume(chunk, include_trends=True), chunks):
+                fetched.update((keyword.lower(), data) for keyword, data in part.items())
+        _store_cached_volumes(fetched)
+        results.update(fetched)
         
         if not results:
             logger.warning("No results returned from search volume API")
             return pd.DataFrame()
         
-        # Process the results into a DataFrame with monthly data
-        rows = []
-        
-        for keyword, data in results.items():
-            # Extract monthly trend data
-            if "monthly_trends" in data and data["monthly_trends"]:
-                # Add rows for each month in the trend data
-                for month_data in data["monthly_trends"]:
-                    rows.append({
-                        "keyword": keyword,
-                        "year": month_data.get("year", 0),
-                        "month": month_data.get("month", 0),
-                        "search_volume": month_data.get("search_volume", 0),
-                        "competition": data.get("competition", 0.0),
-                        "cpc": data.get("cpc", 0.0),
-                        "avg_monthly_volume": data.get("search_volume", 0)  # Store average in each row
-                    })
-            else:
-                # If no monthly data, add a single row with the overall volume
-                import datetime
-                now = datetime.datetime.now()
-                rows.append({
-                    "keyword": keyword,
+        # One record per keyword; keywords without monthly data get a single
+        # entry for the current month carrying the overall volume
+        now = datetime.datetime.now()
+        records = [
+            {
+                "keyword": keyword,
+                "competition": data.get("competition", 0.0),
+                "cpc": data.get("cpc", 0.0),
+                "avg_monthly_volume": data.get("search_volume", 0),  # Store average in each row
+                "monthly_trends": data.get("monthly_trends") or [{
                     "year": now.year,
                     "month": now.month,
                     "search_volume": data.get("search_volume", 0),
-                    "competition": data.get("competition", 0.0),
-                    "cpc": data.get("cpc", 0.0),
-                    "avg_monthly_volume": data.get("search_volume", 0)
-                })
+                }],
+            }
+            for keyword, data in results.items()
+        ]
+        
+        # Flatten to one row per keyword-month in a single pass
+        df = pd.json_normalize(
+            records,
+            record_path="monthly_trends",
+            meta=["keyword", "competition", "cpc", "avg_monthly_volume"],
+        ).reindex(columns=["keyword", "year", "month", "search_volume",
+                           "competition", "cpc", "avg_monthly_volume"])
         
-        if not rows:
+        if df.empty:
             logger.warning("No valid rows created from search volume results")
             return pd.DataFrame()
         
-        # Create DataFrame
-        df = pd.DataFrame(rows)
-        
-        # Ensure proper data types
-        df["search_volume"] = pd.to_numeric(df["search_volume"], errors="coerce").fillna(0).astype(int)
-        df["year"] = pd.to_numeric(df["year"], errors="coerce").fillna(0).astype(int)
-        df["month"] = pd.to_numeric(df["month"], errors="coerce").fillna(0).astype(int)
-        df["competition"] = pd.to_numeric(df["competition"], errors="coerce").fillna(0.0).astype(float)
-        df["cpc"] = pd.to_numeric(df["cpc"], errors="coerce").fillna(0.0).astype(float)
-        df["avg_monthly_volume"] = pd.to_numeric(df["avg_monthly_volume"], errors="coerce").fillna(0).astype(int)
+        # Ensure proper data types (all numeric columns in one pass)
+        numeric_cols = list(_VOLUME_DTYPES)
+        df[numeric_cols] = (
+            df[numeric_cols]
+            .apply(pd.to_numeric, errors="coerce")
+            .fillna(0)
+            .astype(_VOLUME_DTYPES)
+        )
         
         logger.info(f"Created DataFrame with {len(df)} rows of search volume data")
         
@@ -259,34 +363,27 @@ def combine_data_for_assistant(query: str) -> Dict[str, Any]:
     logger.info(f"Combining data from Pinecone namespaces for query: {query}")
     
     try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=secret("OPENAI_API_KEY"))
-        
-        # Initialize Pinecone
-        pc = Pinecone(api_key=secret("PINECONE_API_KEY"))
-        index = pc.Index("zecompete")
+        index = _get_index("zecompete")
         
         # Generate embedding for the query
-        response = client.embeddings.create(
+        response = openai_client().embeddings.create(
             model="text-embedding-3-small",
-            input=[query]
+            input=[query],
+            timeout=EMBED_TIMEOUT
         )
         query_embedding = response.data[0].embedding
         
-        # Query both namespaces
-        maps_results = index.query(
-            vector=query_embedding,
-            top_k=10,
-            namespace="maps",
-            include_metadata=True
-        )
-        
-        keywords_results = index.query(
-            vector=query_embedding,
-            top_k=10,
-            namespace="keywords",
-            include_metadata=True
-        )
+        # Query both namespaces concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            maps_results, keywords_results = executor.map(
+                lambda namespace: index.query(
+                    vector=query_embedding,
+                    top_k=10,
+                    namespace=namespace,
+                    include_metadata=True
+                ),
+                ("maps", "keywords")
+            )
         
         # Process maps data
         business_data = []
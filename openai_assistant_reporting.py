@@ -2,13 +2,19 @@
 openai_assistant_reporting.py - Generate advanced reports using OpenAI Assistant with combined data
 """
 import os
+import random
 import time
 import json
-import pandas as pd
 import streamlit as st
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
-from src.config import secret
+from src.config import openai_client
+
+# Assistant run polling interval bounds (seconds)
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 1.5
+
+# Assistant run statuses that mean "keep polling"
+_PENDING_RUN_STATUSES = frozenset({"queued", "in_progress"})
 
 class AssistantReporter:
     """
@@ -17,7 +23,7 @@ class AssistantReporter:
     
     def __init__(self):
         """Initialize the AssistantReporter"""
-        self.client = OpenAI(api_key=secret("OPENAI_API_KEY"))
+        self.client = openai_client()
         self.assistant_id = self._get_or_create_assistant()
     
     def _get_or_create_assistant(self) -> str:
@@ -146,6 +152,12 @@ class AssistantReporter:
             Generated report as markdown text
         """
         try:
+            # If the Pinecone lookup found nothing, there is nothing for the
+            # assistant to analyse: skip the file upload and the run
+            has_record_keys = "businesses" in combined_data or "keywords" in combined_data
+            if has_record_keys and not (combined_data.get("businesses") or combined_data.get("keywords")):
+                return "No business or keyword data was found for this query. Run the data collection and keyword pipeline first."
+            
             # Convert data to JSON string
             json_data = json.dumps(combined_data, indent=2)
             
@@ -159,14 +171,8 @@ class AssistantReporter:
             if not self.attach_file_to_assistant(file_id):
                 return "Error: Failed to attach file to assistant."
             
-            # Create a thread
-            thread = self.client.beta.threads.create()
-            
-            # Add a message to the thread
-            self.client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=f"""
+            # Message for the assistant
+            message = f"""
                 Please analyze the attached combined data file with business and keyword information.
                 
                 User Query: {query}
@@ -181,24 +187,27 @@ class AssistantReporter:
                 Include insights on search volume trends, competition metrics, and business performance.
                 Format your response in markdown for readability.
                 """
-            )
             
-            # Run the assistant
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.assistant_id
+            # Create the thread, add the message and start the run in a
+            # single API call
+            run = self.client.beta.threads.create_and_run(
+                assistant_id=self.assistant_id,
+                thread={"messages": [{"role": "user", "content": message}]}
             )
+            thread_id = run.thread_id
             
-            # Poll for completion
-            while run.status in ["queued", "in_progress"]:
+            # Poll for completion, backing off from short to longer waits
+            # (with a little jitter so concurrent sessions don't poll in step)
+            delay = POLL_INITIAL_DELAY
+            while run.status in _PENDING_RUN_STATUSES:
+                time.sleep(delay - random.uniform(0, delay * 0.1))
+                delay = min(delay * 1.7, POLL_MAX_DELAY)
+                
                 # Check status
                 run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
+                    thread_id=thread_id,
                     run_id=run.id
                 )
-                
-                # Wait a bit before polling again
-                time.sleep(2)
             
             # Check if the run completed successfully
             if run.status != "completed":
@@ -206,7 +215,7 @@ class AssistantReporter:
             
             # Get the assistant's response
             messages = self.client.beta.threads.messages.list(
-                thread_id=thread.id
+                thread_id=thread_id
             )
             
             # Get the latest assistant message
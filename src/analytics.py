@@ -1,16 +1,14 @@
 # src/analytics.py - Updated to handle both business and keyword data
+from concurrent.futures import ThreadPoolExecutor
 from pinecone import Pinecone
-from src.config import secret
-from openai import OpenAI
+from src.config import EMBED_TIMEOUT, secret, openai_client
+from openai import APITimeoutError, RateLimitError
 
 # Updated Pinecone initialization
 pc = Pinecone(api_key=secret("PINECONE_API_KEY"))
 INDEX_NAME = "zecompete"
 index = pc.Index(INDEX_NAME)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=secret("OPENAI_API_KEY"))
-
 def insight_question(question: str) -> str:
     """
     Ask a question grounded in your Pinecone data.
@@ -18,24 +16,32 @@ def insight_question(question: str) -> str:
     """
     try:
         # Create an embedding for the question
-        response = client.embeddings.create(
+        response = openai_client().embeddings.create(
             model="text-embedding-3-small",
-            input=[question]
+            input=[question],
+            timeout=EMBED_TIMEOUT
         )
         query_embedding = response.data[0].embedding
         
-        # Query both maps and keywords namespaces
+        # Query both maps and keywords namespaces concurrently
         map_contexts = []
         keyword_contexts = []
         
-        # Try maps namespace first
-        try:
-            results = index.query(
-                vector=query_embedding,
-                top_k=8,
-                namespace="maps",
-                include_metadata=True
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            maps_query, keywords_query = (
+                executor.submit(
+                    index.query,
+                    vector=query_embedding,
+                    top_k=8,
+                    namespace=namespace,
+                    include_metadata=True
+                )
+                for namespace in ("maps", "keywords")
             )
+        
+        # Business context from the maps namespace
+        try:
+            results = maps_query.result()
             map_contexts = [
                 f"Business: {match.metadata.get('name', '')}, "
                 f"Location: {match.metadata.get('city', '')}, "
@@ -45,14 +51,9 @@ def insight_question(question: str) -> str:
         except Exception as e:
             print(f"Error querying maps namespace: {str(e)}")
         
-        # Then try keywords namespace
+        # Keyword context from the keywords namespace
         try:
-            results = index.query(
-                vector=query_embedding,
-                top_k=8,
-                namespace="keywords",
-                include_metadata=True
-            )
+            results = keywords_query.result()
             keyword_contexts = [
                 f"Keyword: {match.metadata.get('keyword', '')}, "
                 f"Search Volume: {match.metadata.get('search_volume', 'N/A')}, "
@@ -90,11 +91,20 @@ def insight_question(question: str) -> str:
             please say so and answer based only on what is available.
             """
             
-            chat_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
-            )
+            try:
+                chat_response = openai_client().chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2
+                )
+            except (RateLimitError, APITimeoutError) as e:
+                # Don't make the user wait out the rate limit; show them the
+                # matching records we already retrieved instead
+                print(f"OpenAI unavailable, answering from retrieved data: {str(e)}")
+                return (
+                    "The AI service is busy right now, so here is the most relevant data I found:\n"
+                    + context_text
+                )
             return chat_response.choices[0].message.content
         else:
             return "I don't have enough information in the database to answer that question."
@@ -7,13 +7,53 @@ Usage:
 """
 
 import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-def secret(key: str) -> str:
-    # Works both inside Streamlit and in plain Python
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+_MISSING = object()
+
+# Read timeout (seconds) for embedding requests, which return quickly; chat
+# and assistant calls keep the SDK's long default
+EMBED_TIMEOUT = 30.0
+
+@lru_cache(maxsize=32)
+def secret(key: str, default=_MISSING) -> str:
+    # Works both inside Streamlit and in plain Python.
+    # Cached: keys are read on every API call but don't change at runtime
+    # (a missing key without a default raises KeyError, which is not cached).
     try:
         import streamlit as st
         if key in st.secrets:          # type: ignore[attr-defined]
             return st.secrets[key]
     except ModuleNotFoundError:
         pass
-    return os.environ[key]
+    if default is _MISSING:
+        return os.environ[key]
+    return os.environ.get(key, default)
+
+@lru_cache(maxsize=1)
+def openai_client() -> "OpenAI":
+    """
+    OpenAI client shared by every module, created on first use.
+
+    One pooled connection set is reused across embeddings, chat and
+    assistant calls, and 429/5xx responses are retried by the client.
+    Only the connect timeout is set here; the read timeout stays at the
+    SDK default so long completions aren't cut off and retried.
+    openai and httpx are imported here so modules that only need secret()
+    don't load them.
+    """
+    import httpx
+    from openai import DEFAULT_TIMEOUT, DefaultHttpxClient, OpenAI
+    
+    return OpenAI(
+        api_key=secret("OPENAI_API_KEY"),
+        max_retries=3,
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT.read, connect=5.0),
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+        ),
+    )
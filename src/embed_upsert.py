@@ -1,53 +1,129 @@
-from typing import Iterable, Dict, List
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List
 from pinecone import Pinecone  # Updated import
 import pandas as pd
-from openai import OpenAI
-from src.config import secret
+from src.config import EMBED_TIMEOUT, secret, openai_client
+
+logger = logging.getLogger(__name__)
+
+UPSERT_POOL_THREADS = 30  # concurrent upsert requests per index
 
 # Updated Pinecone initialization
 pc = Pinecone(api_key=secret("PINECONE_API_KEY"))
-INDEX = pc.Index("zecompete")
+INDEX = pc.Index("zecompete", pool_threads=UPSERT_POOL_THREADS)
 
-client = OpenAI(api_key=secret("OPENAI_API_KEY"))
 EMBED_MODEL = "text-embedding-3-small"  # 1536‑dim
+UPSERT_BATCH_SIZE = 100  # vectors per Pinecone upsert request
 
 # --- helpers -----------------------------------------------------
+# Embeddings already computed in this process, keyed by (model, text), with
+# the least recently used dropped past EMBED_CACHE_MAX_ENTRIES. Vectors are
+# kept as float32 arrays (~6 KB each, vs ~50 KB as a list of Python floats).
+# The same place names and keywords come back on every rerun for a brand.
+EMBED_CACHE_MAX_ENTRIES = 1000
+_EMBED_CACHE: "OrderedDict[tuple, array]" = OrderedDict()
+# Only held while reading or updating the cache, never during the OpenAI call
+_EMBED_LOCK = threading.Lock()
+
 def _embed(texts: List[str]) -> List[List[float]]:
-    res = client.embeddings.create(model=EMBED_MODEL, input=texts)
-    return [d.embedding for d in res.data]
+    """Embed texts, only sending the ones not embedded recently to OpenAI"""
+    found = {}
+    with _EMBED_LOCK:
+        for t in dict.fromkeys(texts):
+            key = (EMBED_MODEL, t)
+            if key in _EMBED_CACHE:
+                _EMBED_CACHE.move_to_end(key)
+                found[t] = _EMBED_CACHE[key]
+    
+    missing = [t for t in dict.fromkeys(texts) if t not in found]
+    if missing:
+        res = openai_client().embeddings.create(model=EMBED_MODEL, input=missing, timeout=EMBED_TIMEOUT)
+        for text, d in zip(missing, res.data):
+            found[text] = array("f", d.embedding)
+        
+        with _EMBED_LOCK:
+            for text in missing:
+                _EMBED_CACHE[(EMBED_MODEL, text)] = found[text]
+            while len(_EMBED_CACHE) > EMBED_CACHE_MAX_ENTRIES:
+                _EMBED_CACHE.popitem(last=False)
+    
+    return [found[t].tolist() for t in texts]
 
-def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
-    # First, clear existing data from all maps namespace
+def _clear_namespace(namespace: str) -> None:
+    """Delete every vector in a namespace, logging (not raising) failures"""
     try:
-        print(f"Clearing ALL existing data from 'maps' namespace in Pinecone...")
-        
-        # Delete all data in the maps namespace
-        INDEX.delete(delete_all=True, namespace="maps")
+        # Delete all data in the namespace
+        INDEX.delete(delete_all=True, namespace=namespace)
         
-        print(f"Successfully cleared all previous data from 'maps' namespace")
+        print(f"Successfully cleared all previous data from '{namespace}' namespace")
     except Exception as e:
-        print(f"Warning: Could not clear previous data: {str(e)}")
+        print(f"Warning: Could not clear previous '{namespace}' data: {str(e)}")
+
+def _clear_namespace_async(namespace: str) -> Future:
+    """Start clearing a namespace in a background thread"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(_clear_namespace, namespace)
+    executor.shutdown(wait=False)
+    return future
+
+def _upsert_in_batches(records: List[tuple], namespace: str, batch_size: int = UPSERT_BATCH_SIZE) -> None:
+    """
+    Upsert records in fixed-size batches to stay under Pinecone's request
+    size limit. Batches are sent concurrently on the index's thread pool.
+    """
+    n_batches = -(-len(records) // batch_size)
+    pending = []
+    for i in range(0, len(records), batch_size):
+        batch = records[i:i+batch_size]
+        print(f"Upserting batch {i//batch_size + 1}/{n_batches} ({len(batch)} records)...")
+        pending.append(INDEX.upsert(vectors=batch, namespace=namespace, async_req=True))
+    
+    # Wait for every batch, re-raising the first failure
+    for result in pending:
+        result.get()
+
+def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
+    upsert_place_records(df.to_dict("records"), brand, city)
+
+def upsert_place_records(places: List[Dict], brand: str, city: str) -> None:
+    """
+    Embed and upsert place dicts (e.g. Apify dataset items) into the
+    'maps' namespace, replacing whatever was there before.
+    """
+    # First, clear existing data from all maps namespace. The delete runs
+    # in the background while the embeddings are generated.
+    print(f"Clearing ALL existing data from 'maps' namespace in Pinecone...")
+    cleared = _clear_namespace_async("maps")
     
     # Check if 'name' exists or try alternative column names
-    if 'name' in df.columns:
+    fields = places[0].keys() if places else ()
+    if 'name' in fields:
         name_column = 'name'
-    elif 'title' in df.columns:
+    elif 'title' in fields:
         name_column = 'title'
     else:
-        # If neither exists, create a placeholder
-        df['name'] = f"{brand} location in {city}"
-        name_column = 'name'
+        # If neither exists, use a placeholder
+        name_column = None
     
-    print(f"Using column '{name_column}' for place names")
+    placeholder = f"{brand} location in {city}"
+    names = [row.get(name_column, placeholder) if name_column else placeholder for row in places]
+    
+    print(f"Using column '{name_column or 'name'}' for place names")
     
     # Create embeddings
-    print(f"Generating embeddings for {len(df)} place names...")
-    vecs = _embed(df[name_column].tolist())
+    print(f"Generating embeddings for {len(names)} place names...")
+    vecs = _embed(names)
     print(f"Generated {len(vecs)} embeddings")
     
     # Create records with flexible field mapping
     records = []
-    for i, (_, row) in enumerate(df.iterrows()):
+    for i, row in enumerate(places):
+        name = names[i]
+        
         # Create a unique ID even if placeId is missing
         if 'placeId' in row:
             record_id = f"place-{row['placeId']}"
@@ -58,7 +134,7 @@ def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
         metadata = {
             "brand": brand,
             "city": city,
-            "name": row[name_column]
+            "name": name
         }
         
         # Add optional fields if available
@@ -68,7 +144,7 @@ def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
             elif 'rating' in row and pd.notna(row['rating']):
                 metadata["rating"] = float(row['rating'])
         except Exception as e:
-            print(f"Warning: Could not convert rating for {row[name_column]}: {str(e)}")
+            print(f"Warning: Could not convert rating for {name}: {str(e)}")
             
         try:
             if 'reviewsCount' in row and pd.notna(row['reviewsCount']):
@@ -76,7 +152,7 @@ def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
             elif 'reviews' in row and pd.notna(row['reviews']):
                 metadata["reviews"] = int(row['reviews'])
         except Exception as e:
-            print(f"Warning: Could not convert reviews for {row[name_column]}: {str(e)}")
+            print(f"Warning: Could not convert reviews for {name}: {str(e)}")
             
         try:
             if 'gpsCoordinates' in row and isinstance(row['gpsCoordinates'], dict):
@@ -87,14 +163,17 @@ def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
                 metadata["lat"] = row['latitude']
                 metadata["lng"] = row['longitude']
         except Exception as e:
-            print(f"Warning: Could not process coordinates for {row[name_column]}: {str(e)}")
+            print(f"Warning: Could not process coordinates for {name}: {str(e)}")
             
         records.append((record_id, vecs[i], metadata))
     
+    # The namespace must be empty before writing the new records
+    cleared.result()
+    
     # Upsert to Pinecone
     if records:
         print(f"Upserting {len(records)} records to Pinecone...")
-        INDEX.upsert(vectors=records, namespace="maps")
+        _upsert_in_batches(records, namespace="maps")
         print(f"Successfully upserted {len(records)} records to Pinecone")
     else:
         print(f"Warning: No records to upsert for {brand} in {city}")
@@ -109,16 +188,10 @@ def upsert_places(df: pd.DataFrame, brand: str, city: str) -> None:
         print(f"Warning: Could not verify upsert: {str(e)}")
 
 def upsert_keywords(df: pd.DataFrame, city: str) -> None:
-    # First, clear existing keyword data
-    try:
-        print(f"Clearing existing keyword data from Pinecone...")
-        
-        # Delete all data in the keywords namespace
-        INDEX.delete(delete_all=True, namespace="keywords")
-        
-        print(f"Successfully cleared previous keyword data")
-    except Exception as e:
-        print(f"Warning: Could not clear previous keyword data: {str(e)}")
+    # First, clear existing keyword data. The delete runs in the
+    # background while the embeddings are generated.
+    print(f"Clearing existing keyword data from Pinecone...")
+    cleared = _clear_namespace_async("keywords")
     
     # Check if we have trend data in separate rows or as a nested structure
     has_trend_columns = all(col in df.columns for col in ['keyword', 'year', 'month', 'search_volume'])
@@ -180,9 +253,8 @@ def upsert_keywords(df: pd.DataFrame, city: str) -> None:
     
     try:
         # Check data types before creating records
-        print("Checking data types in DataFrame...")
-        print(f"DataFrame columns: {df.columns.tolist()}")
-        print(f"DataFrame data types: {df.dtypes}")
+        logger.debug("DataFrame columns: %s", df.columns.tolist())
+        logger.debug("DataFrame data types before conversion:\n%s", df.dtypes)
         
         # Convert columns to appropriate types
         if 'year' in df.columns:
@@ -194,8 +266,7 @@ def upsert_keywords(df: pd.DataFrame, city: str) -> None:
         if 'search_volume' in df.columns:
             df['search_volume'] = pd.to_numeric(df['search_volume'], errors='coerce').fillna(0).astype(int)
         
-        print("After conversion:")
-        print(f"DataFrame data types: {df.dtypes}")
+        logger.debug("DataFrame data types after conversion:\n%s", df.dtypes)
         
         # Create records
         records = []
@@ -229,13 +300,12 @@ def upsert_keywords(df: pd.DataFrame, city: str) -> None:
         
         print(f"Created {len(records)} keyword records for upsert")
         
+        # The namespace must be empty before writing the new records
+        cleared.result()
+        
         # Upsert in smaller batches if there are many records
         if records:
-            batch_size = 100
-            for i in range(0, len(records), batch_size):
-                batch = records[i:i+batch_size]
-                print(f"Upserting batch {i//batch_size + 1}/{(len(records)//batch_size) + 1} ({len(batch)} records)...")
-                INDEX.upsert(vectors=batch, namespace="keywords")
+            _upsert_in_batches(records, namespace="keywords")
             
             print(f"Successfully upserted {len(records)} keyword records to Pinecone")
         else:
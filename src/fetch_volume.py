@@ -14,6 +14,12 @@ import traceback
 from typing import Any, Dict, List
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Pooled keep-alive connections to DataForSEO, shared by the parallel
+# keyword-chunk requests
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=8))
 
 
 # --------------------------------------------------------------------------- #
@@ -61,7 +67,7 @@ def fetch_volume(keywords: List[str], include_trends: bool = True) -> Dict[str,
 
     print(f"📡  Requesting volume for {len(keywords)} keywords …")
     try:
-        resp = requests.post(ENDPOINT, json=[payload], auth=(dfs_user, dfs_pass), timeout=30)
+        resp = _SESSION.post(ENDPOINT, json=[payload], auth=(dfs_user, dfs_pass), timeout=30)
     except Exception as exc:  # pragma: no cover
         print(f"💥  Network error → {exc}")
         traceback.print_exc()
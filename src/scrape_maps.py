@@ -1,14 +1,236 @@
 import requests
-import json
+import orjson
 import time
+import logging
 import os
 import re
+import hashlib
+from datetime import datetime, timezone
 import pandas as pd
-from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Optional, Sequence, Tuple
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.util.retry import Retry
 from src.config import secret
 
-APIFY_TOKEN = secret("APIFY_TOKEN")
-TASK_ID = "zecodemedia~google-maps-scraper-task"  # Updated correct task ID
+logger = logging.getLogger(__name__)
+
+TASK_ID = secret("APIFY_TASK_ID", "zecodemedia~google-maps-scraper-task")
+
+# Shared session so polling and dataset calls reuse one pooled connection
+# to api.apify.com. Transient errors on idempotent requests are retried
+# here; POSTs that start runs are not retried to avoid duplicate runs.
+_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True,
+)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=_RETRY,
+))
+
+class _ApifyAuth(AuthBase):
+    """
+    Sends the Apify token as a Bearer header. The secret is looked up on
+    the first request rather than at import (secret() caches it after).
+    """
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        r.headers["Authorization"] = f"Bearer {secret('APIFY_TOKEN')}"
+        return r
+
+_SESSION.auth = _ApifyAuth()
+
+# Session for waitForFinish long polls. A read timeout there is not retried
+# by the adapter (read=0): wait_for_task_completion polls again itself, and
+# retrying a 90 s request five times would blow through its time budget.
+_POLL_SESSION = requests.Session()
+_POLL_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=10,
+    max_retries=_RETRY.new(read=0),
+))
+_POLL_SESSION.auth = _SESSION.auth
+
+def apify_session() -> requests.Session:
+    """
+    The pooled session used for all Apify API calls. Requests made with it
+    are authenticated with APIFY_TOKEN, so callers don't set the header.
+    """
+    return _SESSION
+
+# Scraper settings shared by every run, pre-encoded as the inner part of a
+# JSON object (no braces) so only brand/city are serialized per request
+_PAYLOAD_DEFAULTS = orjson.dumps({"maxReviews": 0, "maxImages": 0, "maxItems": 20})[1:-1]
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Fallback for pulling the run ID out of a response body that isn't valid
+# JSON; matches the raw bytes so the body isn't decoded to text first
+_RUN_ID_RE = re.compile(rb'"id"\s*:\s*"([^"]+)"')
+
+# IDs returned by run_apify_task when no real run could be started
+_PLACEHOLDER_RUN_IDS = frozenset({
+    "task-might-have-started", "task-info-failed",
+    "actor-id-not-found", "direct-actor-run-failed",
+    "alternative-method-failed",
+})
+
+# Scrape results cached under data/cache/, one file per request
+CACHE_SUBDIR = "cache"
+CACHE_MAX_AGE = 7 * 24 * 3600  # seconds before cached results are scraped again
+
+# Columns of an Apify dataset CSV export that run_scrape maps, with their
+# types. Text columns are read as str so postal codes and phone numbers
+# keep their leading zeros; missing values stay NaN.
+_CSV_DTYPES = {
+    "title": str,
+    "placeId": str,
+    "searchString": str,
+    "totalScore": "float64",
+    "location/lat": "float64",
+    "location/lng": "float64",
+    "address": str,
+    "city": str,
+    "postalCode": str,
+    "state": str,
+    "phone": str,
+    "website": str,
+}
+_CSV_COLUMNS = frozenset(_CSV_DTYPES) | {"reviewsCount"}
+
+# Realistic dummy records used when the API fails, built once; the
+# {brand}, {city} and {brand_lower} placeholders are filled per call
+_FALLBACK_TEMPLATE = [
+    {
+        "name": name,
+        "placeId": f"fallback-{{brand}}-{i}",
+        "totalScore": 4.0 + (i * 0.2),  # Ratings from 4.0 to 4.6
+        "reviewsCount": 10 + (i * 5),   # Reviews from 10 to 25
+        "gpsCoordinates": {
+            "lat": 12.9716 + (i * 0.01),
+            "lng": 77.5946 + (i * 0.01)
+        },
+        "address": f"{area}, {{city}}, Karnataka, India",
+        "city": "{city}",
+        "state": "Karnataka",
+        "phone": f"+91 9876{i}43210",
+        "website": "https://www.{brand_lower}.com/"
+    }
+    for i, (name, area) in enumerate([
+        ("{brand} - Commercial Street", "Commercial Street"),
+        ("{brand} Store - Forum Mall", "Forum Mall"),
+        ("{brand} Outlet - MG Road", "MG Road"),
+        ("{brand} - Phoenix Mall", "Phoenix Mall"),
+    ])
+]
+
+# Seconds Apify may hold a run-status request open waiting for the run to end
+WAIT_FOR_FINISH = 60
+# Backoff bounds (seconds) between status checks after an error
+POLL_ERROR_INITIAL_DELAY = 2
+POLL_ERROR_MAX_DELAY = 30
+
+# Dataset items fetched per request, and concurrent page requests
+DATASET_PAGE_SIZE = 1000
+DATASET_MAX_WORKERS = 4
+
+# Retries (and backoff bounds, seconds) for rate-limited "start run" POSTs
+START_RUN_RETRIES = 5
+START_RUN_INITIAL_DELAY = 1.5
+START_RUN_MAX_DELAY = 30
+
+# Concurrent scrapes (Apify task runs) started by run_scrapes
+SCRAPE_MAX_WORKERS = 8
+
+# Actor ID behind each task ID, looked up on first use
+_ACTOR_IDS: Dict[str, str] = {}
+
+# Terminal Apify run statuses other than SUCCEEDED
+_FAILED_STATUSES = frozenset({"FAILED", "ABORTED", "TIMED_OUT"})
+
+def _cache_path(data_dir: str, brand: str, city: str) -> str:
+    """Cache file for a scrape, keyed by everything that shapes its results"""
+    key = orjson.dumps([brand.lower(), city.lower(), TASK_ID]) + _PAYLOAD_DEFAULTS
+    digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+    return os.path.join(data_dir, CACHE_SUBDIR, f"{digest}.json")
+
+@lru_cache(maxsize=4)
+def _read_csv_export(csv_path: str, mtime: float) -> pd.DataFrame:
+    """
+    Read an Apify CSV export, parsed once per file version: mtime is part
+    of the cache key so an overwritten file is read again. The returned
+    DataFrame is shared between calls and must not be modified in place.
+    """
+    # Read only the columns we map, with fixed types (no inference)
+    return pd.read_csv(csv_path, dtype=_CSV_DTYPES, usecols=lambda c: c in _CSV_COLUMNS)
+
+def _unwrap_data(data: Dict) -> Dict:
+    """The object from an Apify API response, unwrapping the "data" envelope"""
+    return data.get("data") or data
+
+def _task_payload(brand: str, city: str) -> bytes:
+    """JSON body for a scraper run: the brand/city fields plus the fixed settings"""
+    head = orjson.dumps({"searchStringsArray": [brand], "locationQuery": city})
+    return head[:-1] + b"," + _PAYLOAD_DEFAULTS + b"}"
+
+def _body_preview(resp: requests.Response, limit: int = 1000) -> str:
+    """Start of a response body for logging, without decoding all of it"""
+    return resp.content[:limit].decode("utf-8", "replace")
+
+def _start_run(url: str, payload: bytes) -> requests.Response:
+    """
+    POST a "start run" request, retrying when Apify rate-limits it (429).
+    The session's adapter doesn't retry POSTs, since after a 5xx the run
+    may have started anyway; a 429 means the request was rejected, so
+    sending it again can't start a duplicate run.
+    """
+    delay = START_RUN_INITIAL_DELAY
+    for attempt in range(START_RUN_RETRIES + 1):
+        resp = _SESSION.post(url, data=payload, headers=_JSON_HEADERS)
+        if resp.status_code != 429 or attempt == START_RUN_RETRIES:
+            return resp
+        
+        # Honour Retry-After (seconds) when given, else back off exponentially
+        retry_after = resp.headers.get("Retry-After", "")
+        wait = float(retry_after) if retry_after.isdigit() else delay
+        logger.warning("Apify rate limit hit, retrying in %.1f s", wait)
+        time.sleep(wait)
+        delay = min(delay * 2, START_RUN_MAX_DELAY)
+    return resp
+
+def _run_id_from_response(resp: requests.Response) -> Optional[str]:
+    """Get the run ID from a "start run" response, or None if it failed"""
+    # Accept any 2xx status code as success
+    if not 200 <= resp.status_code < 300:
+        return None
+    
+    run_id = None
+    try:
+        data = orjson.loads(resp.content)
+    except ValueError:
+        data = None
+    
+    if isinstance(data, dict):
+        # Apify wraps the run object in a "data" envelope
+        run_id = _unwrap_data(data).get("id")
+    else:
+        # Not a JSON object; try to extract the ID from the raw body
+        logger.info("Response is not valid JSON, trying to extract run ID from response body")
+        id_match = _RUN_ID_RE.search(resp.content)
+        if id_match:
+            run_id = id_match.group(1).decode("utf-8", "replace")
+            logger.info("Extracted run ID from response: %s", run_id)
+    
+    if run_id:
+        logger.info("Apify task started with run ID: %s", run_id)
+    else:
+        logger.warning("Run ID not found in response")
+    return run_id
 
 def run_apify_task(brand: str, city: str, wait: bool = False) -> Tuple[str, Optional[List[Dict]]]:
     """
@@ -22,82 +244,40 @@ def run_apify_task(brand: str, city: str, wait: bool = False) -> Tuple[str, Opti
     Returns:
         Tuple of (run_id, results or None)
     """
-    print(f"Starting Apify task for {brand} in {city}...")
-    print(f"Using task ID: {TASK_ID}")
+    logger.info("Starting Apify task for %s in %s...", brand, city)
+    logger.debug("Using task ID: %s", TASK_ID)
     
     url = f"https://api.apify.com/v2/actor-tasks/{TASK_ID}/runs"
-    params = {"token": APIFY_TOKEN}
     
     # Log API token info (safely)
-    if APIFY_TOKEN:
-        print(f"API token available: {APIFY_TOKEN[:4]}...{APIFY_TOKEN[-4:]} (length: {len(APIFY_TOKEN)})")
-    else:
-        print("ERROR: No API token available!")
+    token = secret("APIFY_TOKEN", "")
+    if not token:
+        logger.error("No API token available!")
     
-    payload = {
-        "searchStringsArray": [brand],
-        "locationQuery": city,
-        "maxReviews": 0,
-        "maxImages": 0,
-        "maxItems": 20
-    }
+    payload = _task_payload(brand, city)
     
-    print(f"Request URL: {url}")
-    print(f"Payload: {json.dumps(payload)}")
+    # Request details are only formatted when debug logging is on
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        if token:
+            logger.debug("API token available: %s...%s (length: %d)", token[:4], token[-4:], len(token))
+        logger.debug("Request URL: %s", url)
+        logger.debug("Payload: %s", payload.decode())
     
     run_id = None
     
     # Start the task
     try:
-        # Try with query parameters first
-        resp = requests.post(url, params=params, json=payload)
-        print(f"Query param response status: {resp.status_code}")
-        print(f"Response content: {resp.text[:1000]}")
-        
-        # Accept any 2xx status code as success
-        if 200 <= resp.status_code < 300:
-            try:
-                data = resp.json()
-                run_id = data.get("id")
-                if run_id:
-                    print(f"Apify task started with run ID: {run_id}")
-                else:
-                    print("Run ID not found in response, trying to extract from response text")
-                    # Try to extract ID from response text
-                    id_match = re.search(r'"id"\s*:\s*"([^"]+)"', resp.text)
-                    if id_match:
-                        run_id = id_match.group(1)
-                        print(f"Extracted run ID from response: {run_id}")
-            except Exception as e:
-                print(f"Error parsing response JSON: {str(e)}")
+        resp = _start_run(url, payload)
+        logger.info("Response status: %s", resp.status_code)
+        if debug:
+            logger.debug("Response content: %s", _body_preview(resp))
         
-        # If that didn't work, try with Authorization header
-        if not run_id:
-            print("Trying with Authorization header instead...")
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            resp = requests.post(url, headers=headers, json=payload)
-            print(f"Auth header response status: {resp.status_code}")
-            print(f"Auth header response: {resp.text[:1000]}")
-            
-            if 200 <= resp.status_code < 300:
-                try:
-                    data = resp.json()
-                    run_id = data.get("id")
-                    if run_id:
-                        print(f"Apify task started with run ID: {run_id}")
-                    else:
-                        print("Run ID not found in response, trying to extract from response text")
-                        # Try to extract ID from response text
-                        id_match = re.search(r'"id"\s*:\s*"([^"]+)"', resp.text)
-                        if id_match:
-                            run_id = id_match.group(1)
-                            print(f"Extracted run ID from response: {run_id}")
-                except Exception as e:
-                    print(f"Error parsing response JSON: {str(e)}")
+        run_id = _run_id_from_response(resp)
         
-        # If we still don't have a run ID, try the alternative method
+        # If we don't have a run ID, try the alternative method
         if not run_id:
-            print("Standard methods failed, trying alternative approach...")
+            logger.info("Standard method failed, trying alternative approach...")
             return run_apify_task_alternative(brand, city)
         
         # If we have a run ID but don't need to wait, return it
@@ -108,72 +288,74 @@ def run_apify_task(brand: str, city: str, wait: bool = False) -> Tuple[str, Opti
         return wait_for_task_completion(run_id, brand, city)
     
     except Exception as e:
-        print(f"Error starting Apify task: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error starting Apify task: %s", e)
         
         # Even if we got an exception, check if a task might have started
         # by listing the most recent runs
         try:
-            print("Checking if task started despite error...")
+            logger.info("Checking if task started despite error...")
             list_url = f"https://api.apify.com/v2/actor-tasks/{TASK_ID}/runs"
-            params = {"token": APIFY_TOKEN}
-            list_resp = requests.get(list_url, params=params)
+            list_resp = _SESSION.get(list_url)
             
             if list_resp.status_code == 200:
-                data = list_resp.json()
+                data = orjson.loads(list_resp.content)
                 if data.get("data") and len(data["data"]) > 0:
                     # Get the most recent run
                     latest_run = data["data"][0]
                     latest_run_id = latest_run.get("id")
                     
                     if latest_run_id:
-                        print(f"Found recent run ID: {latest_run_id}")
+                        logger.info("Found recent run ID: %s", latest_run_id)
                         created_at = latest_run.get("startedAt")
                         # If started within the last minute, assume it's our run
+                        # (startedAt is UTC, e.g. "2025-04-01T12:00:00.000Z")
                         if created_at:
-                            created_time = time.strptime(created_at.split(".")[0], "%Y-%m-%dT%H:%M:%S")
-                            now = time.gmtime()
-                            if time.mktime(now) - time.mktime(created_time) < 60:
-                                print(f"Found recent run that might be ours: {latest_run_id}")
+                            created_time = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+                            if (datetime.now(timezone.utc) - created_time).total_seconds() < 60:
+                                logger.info("Found recent run that might be ours: %s", latest_run_id)
                                 return latest_run_id, None
         except Exception as recovery_e:
-            print(f"Error during recovery attempt: {str(recovery_e)}")
+            logger.error("Error during recovery attempt: %s", recovery_e)
         
         # If all else fails, use a placeholder ID to avoid UI errors
         # but mark it as a failure in the logs
-        print("All attempts failed, returning placeholder ID")
+        logger.warning("All attempts failed, returning placeholder ID")
         return "task-might-have-started", None
 
 def wait_for_task_completion(run_id: str, brand: str, city: str) -> Tuple[str, Optional[List[Dict]]]:
     """Wait for a task to complete and return the results"""
-    print(f"Waiting for task {run_id} to complete...")
+    logger.info("Waiting for task %s to complete...", run_id)
     
-    params = {"token": APIFY_TOKEN}
     max_wait_time = 300  # 5 minutes max wait
     start_time = time.time()
+    status_url = f"https://api.apify.com/v2/actor-runs/{run_id}"
+    delay = POLL_ERROR_INITIAL_DELAY
     
-    while time.time() - start_time < max_wait_time:
-        status_url = f"https://api.apify.com/v2/actor-runs/{run_id}"
+    while True:
+        # Apify holds the request open until the run finishes or
+        # waitForFinish seconds pass, so no sleep is needed between polls.
+        # Under a second left would mean waitForFinish=0, i.e. busy polling.
+        remaining = max_wait_time - (time.time() - start_time)
+        if remaining < 1:
+            break
+        wait_params = {"waitForFinish": int(min(WAIT_FOR_FINISH, remaining))}
+        # Allow for network latency, but don't run far past the budget
+        timeout = min(wait_params["waitForFinish"] + 30, remaining + 5)
         
         try:
-            # Try with query parameter
-            status_resp = requests.get(status_url, params=params)
+            status_resp = _POLL_SESSION.get(status_url, params=wait_params, timeout=timeout)
             
-            # If that doesn't work, try with Authorization header
             if status_resp.status_code != 200:
-                headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-                status_resp = requests.get(status_url, headers=headers)
-            
-            if status_resp.status_code != 200:
-                print(f"Failed to check task status: {status_resp.status_code}")
-                time.sleep(5)
+                logger.warning("Failed to check task status: %s", status_resp.status_code)
+                time.sleep(delay)
+                delay = min(delay * 2, POLL_ERROR_MAX_DELAY)
                 continue
                 
-            status_data = status_resp.json()
+            status_data = _unwrap_data(orjson.loads(status_resp.content))
             status = status_data.get("status")
+            delay = POLL_ERROR_INITIAL_DELAY
             
-            print(f"Task status: {status}")
+            logger.info("Task status: %s", status)
             
             if status == "SUCCEEDED":
                 # Get the dataset ID
@@ -183,270 +365,249 @@ def wait_for_task_completion(run_id: str, brand: str, city: str) -> Tuple[str, O
                     results = fetch_dataset_items(dataset_id)
                     return run_id, results
                 else:
-                    print("No dataset ID found")
+                    logger.warning("No dataset ID found")
                     return run_id, None
-            elif status in ["FAILED", "ABORTED", "TIMED_OUT"]:
-                print(f"Task ended with status: {status}")
+            elif status in _FAILED_STATUSES:
+                logger.info("Task ended with status: %s", status)
                 return run_id, None
         except Exception as e:
-            print(f"Error checking task status: {str(e)}")
-        
-        time.sleep(10)  # Poll every 10 seconds
+            logger.error("Error checking task status: %s", e)
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_ERROR_MAX_DELAY)
             
-    print("Timeout waiting for task completion")
+    logger.warning("Timeout waiting for task completion")
     return run_id, None
 
 def run_apify_task_alternative(brand: str, city: str) -> Tuple[str, Optional[List[Dict]]]:
     """Alternative method to run an Apify task"""
-    print(f"Trying alternative method to run Apify task for {brand} in {city}...")
-    
-    # First, try to get actor ID from the task
-    task_url = f"https://api.apify.com/v2/actor-tasks/{TASK_ID}"
-    params = {"token": APIFY_TOKEN}
+    logger.info("Trying alternative method to run Apify task for %s in %s...", brand, city)
     
     try:
-        # Try with query parameter
-        task_resp = requests.get(task_url, params=params)
-        print(f"Task info response: {task_resp.status_code}")
-        
-        # If that doesn't work, try with Authorization header
-        if task_resp.status_code != 200:
-            print("Trying task info with Authorization header...")
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            task_resp = requests.get(task_url, headers=headers)
-            print(f"Auth header task info response: {task_resp.status_code}")
-        
-        if task_resp.status_code != 200:
-            print(f"Could not get task info: {task_resp.text}")
-            return "task-info-failed", None
-            
-        task_data = task_resp.json()
-        actor_id = task_data.get("actId")
+        # The task's actor doesn't change, so only look it up once
+        actor_id = _ACTOR_IDS.get(TASK_ID)
         
         if not actor_id:
-            print("Actor ID not found in task data")
-            return "actor-id-not-found", None
+            # First, try to get actor ID from the task
+            task_url = f"https://api.apify.com/v2/actor-tasks/{TASK_ID}"
+            
+            task_resp = _SESSION.get(task_url)
+            logger.info("Task info response: %s", task_resp.status_code)
+            
+            if task_resp.status_code != 200:
+                logger.warning("Could not get task info: %s", _body_preview(task_resp))
+                return "task-info-failed", None
+                
+            task_data = _unwrap_data(orjson.loads(task_resp.content))
+            actor_id = task_data.get("actId")
+            
+            if not actor_id:
+                logger.warning("Actor ID not found in task data")
+                return "actor-id-not-found", None
             
+            _ACTOR_IDS[TASK_ID] = actor_id
+        
         # Now try to run the actor directly
         actor_url = f"https://api.apify.com/v2/acts/{actor_id}/runs"
         
-        payload = {
-            "searchStringsArray": [brand],
-            "locationQuery": city,
-            "maxReviews": 0,
-            "maxImages": 0,
-            "maxItems": 20
-        }
-        
-        # Try first with query parameter
-        actor_resp = requests.post(actor_url, params=params, json=payload)
-        print(f"Actor run response: {actor_resp.status_code}")
-        
-        run_id = None
+        payload = _task_payload(brand, city)
         
-        # Check if successful
-        if 200 <= actor_resp.status_code < 300:
-            try:
-                data = actor_resp.json()
-                run_id = data.get("id")
-                if run_id:
-                    print(f"Actor run started with ID: {run_id}")
-                    return run_id, None
-            except:
-                pass
+        actor_resp = _start_run(actor_url, payload)
+        logger.info("Actor run response: %s", actor_resp.status_code)
         
-        # If that doesn't work, try with Authorization header
-        if not run_id:
-            print("Trying actor run with Authorization header...")
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            actor_resp = requests.post(actor_url, headers=headers, json=payload)
-            print(f"Auth header actor run response: {actor_resp.status_code}")
-            
-            if 200 <= actor_resp.status_code < 300:
-                try:
-                    data = actor_resp.json()
-                    run_id = data.get("id")
-                    if run_id:
-                        print(f"Actor run started with ID: {run_id}")
-                        return run_id, None
-                except:
-                    pass
+        run_id = _run_id_from_response(actor_resp)
+        if run_id:
+            return run_id, None
         
-        if not run_id:
-            print(f"Failed to run actor directly: {actor_resp.text}")
-            # Last resort - just use a placeholder so UI doesn't show an error
-            return "direct-actor-run-failed", None
+        logger.warning("Failed to run actor directly: %s", _body_preview(actor_resp))
+        # Last resort - just use a placeholder so UI doesn't show an error
+        return "direct-actor-run-failed", None
         
     except Exception as e:
-        print(f"Error in alternative task run method: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in alternative task run method: %s", e)
         return "alternative-method-failed", None
 
-def fetch_dataset_items(dataset_id: str) -> Optional[List[Dict]]:
-    """Fetch items from an Apify dataset"""
-    print(f"Fetching dataset: {dataset_id}")
+def _fetch_dataset_page(url: str, offset: int, fields: Optional[str] = None) -> Tuple[requests.Response, object]:
+    """GET one page of dataset items, returning the response and decoded body"""
+    params = {"offset": offset, "limit": DATASET_PAGE_SIZE}
+    if fields:
+        params["fields"] = fields
+    resp = _SESSION.get(url, params=params)
+    data = orjson.loads(resp.content) if resp.status_code == 200 else None
+    return resp, data
+
+def fetch_dataset_items(dataset_id: str, fields: Optional[Sequence[str]] = None) -> Optional[List[Dict]]:
+    """
+    Fetch items from an Apify dataset. If fields is given, Apify strips
+    every other top-level key before sending the items.
+    """
+    logger.info("Fetching dataset: %s", dataset_id)
     
     url = f"https://api.apify.com/v2/datasets/{dataset_id}/items"
-    params = {"token": APIFY_TOKEN}
+    fields = ",".join(fields) if fields else None
     
     try:
-        # Try with query parameter
-        resp = requests.get(url, params=params)
-        
-        # If that doesn't work, try with Authorization header
-        if resp.status_code != 200:
-            print("Trying dataset fetch with Authorization header...")
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            resp = requests.get(url, headers=headers)
+        resp, data = _fetch_dataset_page(url, 0, fields)
         
         if resp.status_code != 200:
-            print(f"Failed to fetch dataset: {resp.status_code} - {resp.text}")
+            logger.warning("Failed to fetch dataset: %s - %s", resp.status_code, _body_preview(resp))
             return None
             
-        data = resp.json()
-        
         if not isinstance(data, list):
-            print(f"Unexpected dataset format: {type(data)}")
+            logger.warning("Unexpected dataset format: %s", type(data))
             return None
+        
+        # Larger datasets: fetch the remaining pages concurrently, using the
+        # total item count Apify reports with the first page
+        total = int(resp.headers.get("X-Apify-Pagination-Total", len(data)))
+        offsets = range(DATASET_PAGE_SIZE, total, DATASET_PAGE_SIZE)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=DATASET_MAX_WORKERS) as executor:
+                for page_resp, page in executor.map(lambda offset: _fetch_dataset_page(url, offset, fields), offsets):
+                    if page_resp.status_code != 200 or not isinstance(page, list):
+                        logger.warning("Failed to fetch dataset page: %s - %s", page_resp.status_code, _body_preview(page_resp))
+                        return None
+                    data.extend(page)
             
-        print(f"Fetched {len(data)} items from dataset")
+        logger.info("Fetched %d items from dataset", len(data))
         return data
         
     except Exception as e:
-        print(f"Error fetching dataset: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error fetching dataset: %s", e)
         return None
 
 def check_task_status(run_id: str) -> str:
     """Check the status of an Apify task run"""
     # Skip status check for placeholder IDs
-    if run_id in ["task-might-have-started", "task-info-failed", 
-                 "actor-id-not-found", "direct-actor-run-failed", 
-                 "alternative-method-failed"]:
-        print(f"Skipping status check for placeholder ID: {run_id}")
+    if run_id in _PLACEHOLDER_RUN_IDS:
+        logger.info("Skipping status check for placeholder ID: %s", run_id)
         return "UNKNOWN"
     
     url = f"https://api.apify.com/v2/actor-runs/{run_id}"
-    params = {"token": APIFY_TOKEN}
     
     try:
-        # Try with query parameter
-        resp = requests.get(url, params=params)
+        resp = _SESSION.get(url)
         
-        # If that doesn't work, try with Authorization header
         if resp.status_code != 200:
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            resp = requests.get(url, headers=headers)
-        
-        if resp.status_code != 200:
-            print(f"Failed to check task status: {resp.status_code} - {resp.text}")
+            logger.warning("Failed to check task status: %s - %s", resp.status_code, _body_preview(resp))
             return "UNKNOWN"
             
-        data = resp.json()
+        data = _unwrap_data(orjson.loads(resp.content))
         return data.get("status", "UNKNOWN")
         
     except Exception as e:
-        print(f"Error checking task status: {str(e)}")
+        logger.error("Error checking task status: %s", e)
         return "UNKNOWN"
 
 def get_dataset_id_from_run(run_id: str) -> Optional[str]:
     """Get the dataset ID from a completed run"""
     # Skip for placeholder IDs
-    if run_id in ["task-might-have-started", "task-info-failed", 
-                 "actor-id-not-found", "direct-actor-run-failed", 
-                 "alternative-method-failed"]:
-        print(f"Skipping dataset ID lookup for placeholder ID: {run_id}")
+    if run_id in _PLACEHOLDER_RUN_IDS:
+        logger.info("Skipping dataset ID lookup for placeholder ID: %s", run_id)
         return None
     
     url = f"https://api.apify.com/v2/actor-runs/{run_id}"
-    params = {"token": APIFY_TOKEN}
     
     try:
-        # Try with query parameter
-        resp = requests.get(url, params=params)
-        
-        # If that doesn't work, try with Authorization header
-        if resp.status_code != 200:
-            headers = {"Authorization": f"Bearer {APIFY_TOKEN}"}
-            resp = requests.get(url, headers=headers)
+        resp = _SESSION.get(url)
         
         if resp.status_code != 200:
-            print(f"Failed to get run info: {resp.status_code} - {resp.text}")
+            logger.warning("Failed to get run info: %s - %s", resp.status_code, _body_preview(resp))
             return None
             
-        data = resp.json()
+        data = _unwrap_data(orjson.loads(resp.content))
         return data.get("defaultDatasetId")
         
     except Exception as e:
-        print(f"Error getting dataset ID: {str(e)}")
+        logger.error("Error getting dataset ID: %s", e)
         return None
 
 def run_scrape(brand: str, city: str) -> List[Dict]:
     """Run the Google Maps scraper task and return list of place dicts."""
-    print(f"Starting Apify scrape for {brand} in {city}...")
+    logger.info("Starting Apify scrape for %s in %s...", brand, city)
     
-    # Check if we have a recent CSV file with results first
+    # Check if we have a recent results file first
     csv_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
     os.makedirs(csv_dir, exist_ok=True)
     
-    # Look for CSV files with naming pattern like "dataset_googlemapsscrapertask_*"
+    # Raw API results we saved ourselves (see below) are stored as JSON,
+    # one file per (brand, city) request, so the path is known up front
+    cache_path = _cache_path(csv_dir, brand, city)
+    try:
+        fresh = time.time() - os.path.getmtime(cache_path) < CACHE_MAX_AGE
+    except OSError:
+        fresh = False
+    
+    if fresh:
+        logger.info("Found cached results: %s", os.path.basename(cache_path))
+        try:
+            with open(cache_path, "rb") as f:
+                places = orjson.loads(f.read())
+            logger.info("Loaded %d places from cache", len(places))
+            return places
+        except Exception as e:
+            logger.error("Error processing cached results: %s", e)
+            # Fall back to CSV exports / API call
+    
+    # Look for CSV exports with naming pattern like "dataset_googlemapsscrapertask_*"
     csv_files = [f for f in os.listdir(csv_dir) if f.startswith("dataset_googlemapsscrapertask_") and f.endswith(".csv")]
     
     if csv_files:
         # Use the most recent CSV file
-        most_recent_csv = max(csv_files, key=lambda f: os.path.getmtime(os.path.join(csv_dir, f)))
+        mtimes = {f: os.path.getmtime(os.path.join(csv_dir, f)) for f in csv_files}
+        most_recent_csv = max(mtimes, key=mtimes.get)
         csv_path = os.path.join(csv_dir, most_recent_csv)
         
-        print(f"Found existing CSV file: {most_recent_csv}")
+        logger.info("Found existing CSV file: %s", most_recent_csv)
         try:
-            # Read the CSV file
-            df = pd.read_csv(csv_path)
+            df = _read_csv_export(csv_path, mtimes[most_recent_csv])
             
             # Filter for current brand if needed
+            # (plain substring match: brand names aren't regex patterns)
             if 'searchString' in df.columns:
-                filtered_df = df[df['searchString'].str.contains(brand, case=False, na=False)]
-                if len(filtered_df) > 0:
-                    df = filtered_df
+                mask = df['searchString'].str.contains(brand, case=False, na=False, regex=False)
+                if mask.any():
+                    df = df[mask]
             
-            # Convert DataFrame to list of dicts
-            places = df.to_dict('records')
-            print(f"Loaded {len(places)} places from CSV file")
+            logger.info("Loaded %d places from CSV file", len(df))
             
-            # Normalize the data structure for compatibility
-            normalized_places = []
-            for place in places:
-                normalized = {}
-                
-                # Map CSV columns to expected format
-                normalized["name"] = place.get("title", "")
-                normalized["placeId"] = place.get("placeId", f"place-{int(time.time())}")
-                normalized["totalScore"] = place.get("totalScore", 0.0)
-                normalized["reviewsCount"] = place.get("reviewsCount", 0)
-                
-                # Handle coordinates
-                if 'location/lat' in place and 'location/lng' in place:
-                    normalized["gpsCoordinates"] = {
-                        "lat": place.get("location/lat"),
-                        "lng": place.get("location/lng")
-                    }
-                
-                # Add other metadata
-                normalized["address"] = place.get("address", "")
-                normalized["city"] = place.get("city", city)
-                normalized["postalCode"] = place.get("postalCode", "")
-                normalized["state"] = place.get("state", "")
-                normalized["phone"] = place.get("phone", "")
-                normalized["website"] = place.get("website", "")
-                
-                normalized_places.append(normalized)
+            # Normalize the data structure for compatibility, column by column:
+            # map CSV columns to the expected names and fill in missing ones
+            df = df.rename(columns={"title": "name"})
+            defaults = {
+                "name": "",
+                "placeId": f"place-{int(time.time())}",
+                "totalScore": 0.0,
+                "reviewsCount": 0,
+                "address": "",
+                "city": city,
+                "postalCode": "",
+                "state": "",
+                "phone": "",
+                "website": "",
+            }
+            for col, default in defaults.items():
+                if col not in df.columns:
+                    df[col] = default
+            
+            columns = ["name", "placeId", "totalScore", "reviewsCount"]
+            
+            # Handle coordinates
+            if 'location/lat' in df.columns and 'location/lng' in df.columns:
+                df["gpsCoordinates"] = [
+                    {"lat": lat, "lng": lng}
+                    for lat, lng in zip(df["location/lat"], df["location/lng"])
+                ]
+                columns.append("gpsCoordinates")
             
-            print(f"Normalized {len(normalized_places)} places")
+            # Add other metadata
+            columns += ["address", "city", "postalCode", "state", "phone", "website"]
+            normalized_places = df[columns].to_dict("records")
+            
+            logger.info("Normalized %d places", len(normalized_places))
             return normalized_places
             
         except Exception as e:
-            print(f"Error processing CSV file: {str(e)}")
+            logger.error("Error processing CSV file: %s", e)
             # Continue with API call if CSV processing fails
     
     # If no CSV file or processing failed, call the Apify API
@@ -454,48 +615,42 @@ def run_scrape(brand: str, city: str) -> List[Dict]:
     run_id, results = run_apify_task(brand, city, wait=True)
     
     if results:
-        # Save the results to a CSV file for future use
-        df = pd.json_normalize(results)
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        csv_filename = f"dataset_googlemapsscrapertask_{timestamp}.csv"
-        csv_path = os.path.join(csv_dir, csv_filename)
-        df.to_csv(csv_path, index=False)
-        print(f"Saved Apify results to {csv_filename}")
+        # Save the raw results for future use; no need to flatten them
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "wb") as f:
+            f.write(orjson.dumps(results))
+        logger.info("Saved Apify results to %s", os.path.basename(cache_path))
         
         return results
     else:
-        print("API returned empty or invalid data, creating fallback data")
+        logger.warning("API returned empty or invalid data, creating fallback data")
         return create_fallback_data(brand, city)
 
+def run_scrapes(pairs: List[Tuple[str, str]]) -> List[List[Dict]]:
+    """
+    Run several (brand, city) scrapes concurrently; results are returned in
+    the same order as pairs. Each scrape mostly waits on Apify, so threads
+    sharing the pooled session overlap those waits.
+    """
+    with ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS) as executor:
+        return list(executor.map(lambda pair: run_scrape(*pair), pairs))
+
 def create_fallback_data(brand: str, city: str) -> List[Dict]:
     """Create fallback data when API fails"""
-    print(f"Creating fallback data for {brand} in {city}")
+    logger.info("Creating fallback data for %s in %s", brand, city)
     
-    # Generate realistic dummy data
-    locations = [
-        {"name": f"{brand} - Commercial Street", "area": "Commercial Street"},
-        {"name": f"{brand} Store - Forum Mall", "area": "Forum Mall"},
-        {"name": f"{brand} Outlet - MG Road", "area": "MG Road"},
-        {"name": f"{brand} - Phoenix Mall", "area": "Phoenix Mall"}
+    ctx = {"brand": brand, "city": city, "brand_lower": brand.lower()}
+    dummy_data = [
+        {
+            key: (
+                value.format_map(ctx) if isinstance(value, str)
+                else dict(value) if isinstance(value, dict)
+                else value
+            )
+            for key, value in row.items()
+        }
+        for row in _FALLBACK_TEMPLATE
     ]
     
-    dummy_data = []
-    for i, loc in enumerate(locations):
-        dummy_data.append({
-            "name": loc["name"],
-            "placeId": f"fallback-{brand}-{i}",
-            "totalScore": 4.0 + (i * 0.2),  # Ratings from 4.0 to 4.6
-            "reviewsCount": 10 + (i * 5),   # Reviews from 10 to 25
-            "gpsCoordinates": {
-                "lat": 12.9716 + (i * 0.01),
-                "lng": 77.5946 + (i * 0.01)
-            },
-            "address": f"{loc['area']}, {city}, Karnataka, India",
-            "city": city,
-            "state": "Karnataka",
-            "phone": f"+91 9876{i}43210",
-            "website": f"https://www.{brand.lower()}.com/"
-        })
-    
-    print(f"Created {len(dummy_data)} fallback records")
+    logger.info("Created %d fallback records", len(dummy_data))
     return dummy_data
@@ -2,36 +2,115 @@
 Task manager to track and process Apify tasks
 """
 import time
-import json
 import os
+import logging
+import threading
+from contextlib import contextmanager
 from typing import Dict, List, Optional
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from src.scrape_maps import check_task_status, get_dataset_id_from_run, fetch_dataset_items
-from src.embed_upsert import upsert_places
+from src.embed_upsert import upsert_place_records
+
+logger = logging.getLogger(__name__)
+
+# Keyword pipeline, resolved once; None if neither module can be imported
+try:
+    from enhanced_keyword_pipeline import run_business_keyword_pipeline
+except ImportError:
+    # If enhanced_keyword_pipeline is not available, try to use the one from business_keywords_tab
+    try:
+        from business_keywords_tab import run_business_keyword_pipeline
+    except ImportError as e:
+        logger.warning("Keyword pipeline unavailable: %s", e)
+        run_business_keyword_pipeline = None
 
 # Directory to store task state
 TASK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "task_data")
 os.makedirs(TASK_DIR, exist_ok=True)
 
 TASK_STATE_FILE = os.path.join(TASK_DIR, "task_state.json")
+IO_BUFFER_SIZE = 64 * 1024
+STATUS_CHECK_MAX_WORKERS = 16
+TASK_FETCH_MAX_WORKERS = 4
+# Set TASK_STATE_PRETTY=1 to get an indented, hand-readable state file
+_DUMP_OPTIONS = orjson.OPT_INDENT_2 if os.environ.get("TASK_STATE_PRETTY") else 0
 
-def load_task_state() -> Dict:
-    """Load the current task state from disk"""
+# Fields of an Apify place item that are kept for the Pinecone upsert
+PLACE_FIELDS = ("name", "title", "placeId", "totalScore", "reviewsCount",
+                "address", "latitude", "longitude")
+# What to ask Apify for; gpsCoordinates is reduced to lat/lng afterwards
+DATASET_FIELDS = PLACE_FIELDS + ("gpsCoordinates",)
+
+# Each thread (Streamlit session) gets its own task_state_batch() copy
+_batch = threading.local()
+# Serialises the read-merge-write of the state file across threads
+_STATE_LOCK = threading.Lock()
+
+def _read_task_state() -> Dict:
     if os.path.exists(TASK_STATE_FILE):
         try:
-            with open(TASK_STATE_FILE, 'r') as f:
-                return json.load(f)
+            with open(TASK_STATE_FILE, 'rb', buffering=IO_BUFFER_SIZE) as f:
+                return orjson.loads(f.read())
         except Exception as e:
-            print(f"Error loading task state: {str(e)}")
+            logger.error("Error loading task state: %s", e)
     return {"tasks": {}}
 
+def load_task_state() -> Dict:
+    """Load the current task state from disk"""
+    state = getattr(_batch, "state", None)
+    if state is not None:
+        return state
+    return _read_task_state()
+
 def save_task_state(state: Dict):
-    """Save the task state to disk"""
+    """
+    Save the task state to disk. The file is written next to the real one
+    and then swapped in, so readers never see a half-written state.
+    """
+    if getattr(_batch, "state", None) is not None:
+        # Written once when the batch closes
+        _batch.dirty = True
+        return
+    _write_task_state(state)
+
+def _write_task_state(state: Dict):
+    with _STATE_LOCK:
+        # Another session or process may have written since this state was
+        # loaded; keep whichever copy of each task was updated last
+        tasks = state["tasks"]
+        for run_id, task in _read_task_state()["tasks"].items():
+            if run_id not in tasks or task.get("updated_at", 0) > tasks[run_id].get("updated_at", 0):
+                tasks[run_id] = task
+        
+        tmp_file = TASK_STATE_FILE + ".tmp"
+        try:
+            with open(tmp_file, 'wb', buffering=IO_BUFFER_SIZE) as f:
+                f.write(orjson.dumps(state, option=_DUMP_OPTIONS))
+            os.replace(tmp_file, TASK_STATE_FILE)
+        except Exception as e:
+            logger.error("Error saving task state: %s", e)
+
+@contextmanager
+def task_state_batch():
+    """
+    Load the task state once and keep it in memory for the duration of the
+    block. add_task/update_task_status/mark_task_processed called from this
+    thread mutate that copy and the file is rewritten a single time on exit.
+    """
+    if getattr(_batch, "state", None) is not None:
+        # Already inside a batch on this thread; the outer one flushes
+        yield _batch.state
+        return
+    _batch.state = _read_task_state()
+    _batch.dirty = False
     try:
-        with open(TASK_STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=2)
-    except Exception as e:
-        print(f"Error saving task state: {str(e)}")
+        yield _batch.state
+    finally:
+        state, _batch.state = _batch.state, None
+        # Nothing to write if every update in the block was a no-op
+        if _batch.dirty:
+            _write_task_state(state)
 
 def add_task(run_id: str, brand: str, city: str):
     """Add a new task to the state"""
@@ -47,31 +126,57 @@ def add_task(run_id: str, brand: str, city: str):
     }
     
     save_task_state(state)
-    print(f"Added task {run_id} for {brand} in {city} to state")
+    logger.info("Added task %s for %s in %s to state", run_id, brand, city)
 
 def update_task_status(run_id: str, status: str):
     """Update a task's status"""
     state = load_task_state()
     
     if run_id in state["tasks"]:
+        if state["tasks"][run_id]["status"] == status:
+            return
         state["tasks"][run_id]["status"] = status
         state["tasks"][run_id]["updated_at"] = time.time()
         save_task_state(state)
-        print(f"Updated task {run_id} status to {status}")
+        logger.info("Updated task %s status to %s", run_id, status)
     else:
-        print(f"Task {run_id} not found in state")
+        logger.warning("Task %s not found in state", run_id)
 
 def mark_task_processed(run_id: str):
     """Mark a task as processed"""
     state = load_task_state()
     
     if run_id in state["tasks"]:
+        if state["tasks"][run_id]["processed"]:
+            return
         state["tasks"][run_id]["processed"] = True
         state["tasks"][run_id]["updated_at"] = time.time()
         save_task_state(state)
-        print(f"Marked task {run_id} as processed")
+        logger.info("Marked task %s as processed", run_id)
     else:
-        print(f"Task {run_id} not found in state")
+        logger.warning("Task %s not found in state", run_id)
+
+def project_places(data: List[Dict]) -> List[Dict]:
+    """
+    Reduce raw Apify items to PLACE_FIELDS plus gpsCoordinates lat/lng,
+    keeping the first item seen for each placeId.
+    """
+    places = []
+    seen = set()
+    for item in data:
+        pid = item.get("placeId")
+        if pid is not None:
+            if pid in seen:
+                continue
+            seen.add(pid)
+        
+        place = {k: item[k] for k in PLACE_FIELDS if k in item}
+        gps = item.get("gpsCoordinates")
+        if isinstance(gps, dict):
+            place["gpsCoordinates"] = {"lat": gps.get("lat"), "lng": gps.get("lng")}
+        places.append(place)
+    
+    return places
 
 def get_pending_tasks() -> List[Dict]:
     """Get all tasks that are complete but not processed"""
@@ -101,117 +206,112 @@ def get_running_tasks() -> List[Dict]:
 
 def check_running_tasks():
     """Check the status of all running tasks"""
-    running_tasks = get_running_tasks()
+    run_ids = [task["run_id"] for task in get_running_tasks()]
+    if not run_ids:
+        return
     
-    for task in running_tasks:
-        run_id = task["run_id"]
-        current_status = check_task_status(run_id)
-        
-        if current_status != "RUNNING" and current_status != "UNKNOWN":
-            update_task_status(run_id, current_status)
-            print(f"Task {run_id} updated from RUNNING to {current_status}")
+    # The status checks are independent HTTP calls, so issue them together;
+    # the state updates are applied afterwards from this thread
+    with ThreadPoolExecutor(max_workers=min(STATUS_CHECK_MAX_WORKERS, len(run_ids))) as executor:
+        statuses = list(executor.map(check_task_status, run_ids))
+    
+    with task_state_batch():
+        for run_id, current_status in zip(run_ids, statuses):
+            if current_status != "RUNNING" and current_status != "UNKNOWN":
+                update_task_status(run_id, current_status)
+                logger.info("Task %s updated from RUNNING to %s", run_id, current_status)
+
+def _fetch_task_data(run_id: str) -> Optional[List[Dict]]:
+    """Fetch the dataset items of a finished run, or None if there are none"""
+    # Get the dataset ID
+    dataset_id = get_dataset_id_from_run(run_id)
+    
+    if not dataset_id:
+        logger.warning("No dataset ID found for run %s", run_id)
+        return None
+    
+    # Get the data
+    data = fetch_dataset_items(dataset_id, DATASET_FIELDS)
+    
+    if not data:
+        logger.warning("No data found for dataset %s", dataset_id)
+        return None
+    
+    return data
 
 def process_pending_tasks() -> int:
     """Process all pending tasks, returns number of tasks processed"""
     pending_tasks = get_pending_tasks()
     processed = 0
+    if not pending_tasks:
+        return processed
     
-    for task in pending_tasks:
-        run_id = task["run_id"]
-        brand = task["brand"]
-        city = task["city"]
-        
-        print(f"Processing completed task {run_id} for {brand} in {city}")
-        
-        # Get the dataset ID
-        dataset_id = get_dataset_id_from_run(run_id)
-        
-        if not dataset_id:
-            print(f"No dataset ID found for run {run_id}")
-            # Mark as processed anyway to avoid endless retries
-            mark_task_processed(run_id)
-            continue
-        
-        # Get the data
-        data = fetch_dataset_items(dataset_id)
+    # Datasets are downloaded concurrently and handed over in order, so the
+    # next ones arrive while the current task is processed. The Pinecone and
+    # keyword steps stay sequential: each upsert replaces the whole 'maps'
+    # namespace.
+    run_ids = [task["run_id"] for task in pending_tasks]
+    with ThreadPoolExecutor(max_workers=min(TASK_FETCH_MAX_WORKERS, len(run_ids))) as executor:
+        for task, data in zip(pending_tasks, executor.map(_fetch_task_data, run_ids)):
+            if _process_task_data(task, data):
+                processed += 1
+    
+    return processed
+
+def _process_task_data(task: Dict, data: Optional[List[Dict]]) -> bool:
+    """Upsert a task's places and run the keyword pipeline; True on success"""
+    run_id = task["run_id"]
+    brand = task["brand"]
+    city = task["city"]
+    
+    logger.info("Processing completed task %s for %s in %s", run_id, brand, city)
+    
+    if not data:
+        # Mark as processed anyway to avoid endless retries
+        mark_task_processed(run_id)
+        return False
+    
+    # Process the data
+    try:
+        # 1. Project the essential fields, one place per placeId
+        places = project_places(data)
+        logger.info("Projected %d data points to %d places", len(data), len(places))
         
-        if not data:
-            print(f"No data found for dataset {dataset_id}")
-            mark_task_processed(run_id)
-            continue
+        # 2. Upsert places to Pinecone
+        logger.info("Upserting %d places to Pinecone maps namespace", len(places))
+        upsert_place_records(places, brand, city)
         
-        # Process the data
-        try:
-            # 1. Convert data to DataFrame
-            df = pd.json_normalize(data)
-            print(f"Converted {len(data)} data points to DataFrame")
-            
-            # 2. Clean DataFrame
-            # Keep essential columns
-            keep_cols = [c for c in df.columns if c in ["name", "title", "placeId", "totalScore", "reviewsCount", 
-                                                        "gpsCoordinates.lat", "gpsCoordinates.lng", 
-                                                        "address", "latitude", "longitude"]]
-            
-            if keep_cols:
-                df = df[keep_cols].drop_duplicates(subset=keep_cols[0], keep="first").reset_index(drop=True)
-            
-            # 3. Upsert places to Pinecone
-            print(f"Upserting {len(df)} places to Pinecone maps namespace")
-            upsert_places(df, brand, city)
-            
-            # 4. Generate keywords and fetch search volumes
+        # 3. Generate keywords and fetch search volumes
+        if run_business_keyword_pipeline is not None:
             try:
-                # Import the enhanced keyword pipeline functionality directly
-                from enhanced_keyword_pipeline import run_business_keyword_pipeline
-                
-                # Run the keyword pipeline for the city
-                print(f"Running business keyword pipeline for {city}...")
+                logger.info("Running business keyword pipeline for %s...", city)
                 success = run_business_keyword_pipeline(city)
                 
                 if success:
-                    print(f"Successfully completed keyword pipeline for {city}")
+                    logger.info("Successfully completed keyword pipeline for %s", city)
                 else:
-                    print(f"Keyword pipeline failed for {city}")
-            except ImportError:
-                # If enhanced_keyword_pipeline is not available, try to use the one from business_keywords_tab
-                try:
-                    from business_keywords_tab import run_business_keyword_pipeline
-                    
-                    print(f"Running business keyword pipeline from business_keywords_tab for {city}...")
-                    success = run_business_keyword_pipeline(city)
-                    
-                    if success:
-                        print(f"Successfully completed keyword pipeline for {city}")
-                    else:
-                        print(f"Keyword pipeline failed for {city}")
-                except Exception as e:
-                    print(f"Error running keyword pipeline from business_keywords_tab: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.warning("Keyword pipeline failed for %s", city)
             except Exception as e:
-                print(f"Error running keyword pipeline: {str(e)}")
-                import traceback
-                traceback.print_exc()
-            
-            # Mark task as processed
-            mark_task_processed(run_id)
-            processed += 1
-            print(f"Successfully processed task {run_id}")
-            
-        except Exception as e:
-            print(f"Error processing task {run_id}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # Don't mark as processed so we can retry later
-    
-    return processed
+                logger.exception("Error running keyword pipeline: %s", e)
+        
+        # Mark task as processed
+        mark_task_processed(run_id)
+        logger.info("Successfully processed task %s", run_id)
+        return True
+        
+    except Exception as e:
+        logger.exception("Error processing task %s: %s", run_id, e)
+        # Don't mark as processed so we can retry later
+        return False
 
 def process_all_tasks():
     """Check running tasks and process any pending tasks"""
     # First update the status of running tasks
     check_running_tasks()
     
-    # Then process any pending tasks
+    # Then process any pending tasks. Not batched: each task is saved as
+    # processed as soon as it is done, so an interrupted run doesn't upsert
+    # finished tasks again.
     processed = process_pending_tasks()
     
     return processed
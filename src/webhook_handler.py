@@ -8,8 +8,8 @@ import secrets
 import streamlit as st
 from typing import Dict, Any, Optional
 from src.config import secret
-from src.scrape_maps import fetch_dataset_items
-from src.task_manager import add_task, update_task_status, process_all_tasks
+from src.scrape_maps import apify_session, fetch_dataset_items
+from src.task_manager import DATASET_FIELDS, project_places, update_task_status, process_all_tasks
 
 def generate_webhook_secret() -> str:
     """Generate a random webhook secret"""
@@ -44,11 +44,9 @@ def verify_webhook_signature(payload: Dict[str, Any], signature: str, secret: st
 
 def create_apify_webhook(task_id: str, callback_url: str) -> Optional[str]:
     """Create a webhook in Apify to notify when a task completes"""
-    import requests
-    
-    # Get Apify token
+    # The Apify session authenticates with this token
     try:
-        token = secret("APIFY_TOKEN")
+        secret("APIFY_TOKEN")
     except:
         print("Apify token not found")
         return None
@@ -59,12 +57,6 @@ def create_apify_webhook(task_id: str, callback_url: str) -> Optional[str]:
     # Create the webhook
     url = f"https://api.apify.com/v2/actor-tasks/{task_id}/webhooks"
     
-    # Prepare the request
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    
     # Prepare the payload
     payload = {
         "isEnabled": True,
@@ -81,7 +73,7 @@ def create_apify_webhook(task_id: str, callback_url: str) -> Optional[str]:
     
     # Send the request
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = apify_session().post(url, json=payload)
         
         if response.status_code == 201:
             webhook_data = response.json()
@@ -126,29 +118,19 @@ def handle_webhook_payload(payload: Dict[str, Any]) -> bool:
 
 def process_dataset_directly(dataset_id: str, brand: str, city: str) -> bool:
     """Process an Apify dataset directly without a webhook"""
-    from src.run_pipeline import run
-    import pandas as pd
+    from src.embed_upsert import upsert_place_records
     
     # Fetch the dataset
-    data = fetch_dataset_items(dataset_id)
+    data = fetch_dataset_items(dataset_id, DATASET_FIELDS)
     
     if not data:
         print(f"No data found for dataset {dataset_id}")
         return False
     
     try:
-        # Option 1: Use the high-level run function
-        run(brand, city)
+        # Same projection and placeId dedupe as the task pipeline
+        upsert_place_records(project_places(data), brand, city)
         return True
     except Exception as e:
         print(f"Error processing dataset {dataset_id}: {str(e)}")
-        
-        # Option 2: Try direct processing
-        try:
-            from src.embed_upsert import upsert_places
-            df = pd.json_normalize(data)
-            upsert_places(df, brand, city)
-            return True
-        except Exception as e2:
-            print(f"Error with direct processing: {str(e2)}")
-            return False
+        return False
@@ -15,12 +15,9 @@ import os
 import sys
 import time
 from types import ModuleType
-from typing import Optional
 
 import streamlit as st
-import pandas as pd
 from pinecone import Pinecone
-from pinecone.core.client.exceptions import NotFoundException
 
 # ---------------------------------------------------------------
 # 1️⃣  Ensure the repo root is on PYTHONPATH so we can import from